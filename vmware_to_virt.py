@@ -1,19 +1,61 @@
 import os
+import re
+import codecs
+import json
+import mmap
 import sys
+import uuid
 import click
 import subprocess
+import tempfile
+import threading
 import xml.etree.ElementTree as ET
-from defusedxml.ElementTree import fromstring
 import shutil
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import logging
 
+# Optional: python-magic loads libmagic's database once instead of once per 'file' run
+try:
+    import magic
+except ImportError:
+    magic = None
+
+# ioctl request for a copy-on-write file clone (linux/fs.h)
+FICLONE = 0x40049409
+
 class VMwareToVirtConverter:
-    def __init__(self, input_dir, output_dir):
+    # Markers looked for in VMDK headers, matched in a single pass over the buffer
+    _VMDK_CLASSIFY = re.compile(rb'(?P<snap>parentFileNameHint)|(?P<desc>createType)|(?P<vmdk>VMDK)')
+    # One 'key = "value"' entry of a VMX file
+    _VMX_LINE = re.compile(rb'^[ \t]*([A-Za-z0-9_.:-]+)[ \t]*=[ \t]*"?([^"\r\n]*?)"?[ \t]*\r?$', re.M)
+    
+    def __init__(self, input_dir, output_dir, verify=False, repair=False):
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
+        self.verify = verify
+        self.repair = repair
         self.vm_name = None
+        self.vmx_file = None
         self.disk_files = []
+        self.convert_options = []
+        # Live qemu-img progress only makes sense while a single disk is converting
+        self._stream_progress = True
+        # qemu-img source format per VMDK, known up front for text descriptors
+        self._disk_formats = {}
+        # External tools, looked up on PATH once instead of spawning them to check
+        self._tools = {tool: shutil.which(tool) for tool in ("qemu-img", "fdisk", "file")}
+        self._magic = None
+        if magic is not None and hasattr(magic, 'Magic'):
+            try:
+                self._magic = magic.Magic()
+            except Exception:
+                pass  # Broken libmagic install, fall back to the file command
+        self._qemu_img_version = None
+        # Input directory listing, filled by a single scan in validate_input()
+        self._files_by_ext = defaultdict(list)
+        self._stat_cache = {}
         
     def validate_input(self):
         """Validate the input directory contains VMware VM files"""
@@ -23,36 +65,66 @@ class VMwareToVirtConverter:
         if not self.input_dir.is_dir():
             raise NotADirectoryError(f"Input path '{self.input_dir}' is not a directory")
             
+        # Scan the directory once and group files by extension
+        self._files_by_ext.clear()
+        self._stat_cache.clear()
+        with os.scandir(self.input_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    path = Path(entry.path)
+                    self._files_by_ext[path.suffix.lower()].append(path)
+                    self._stat_cache[path] = entry.stat()
+        
         # Check for at least one .vmx file
-        vmx_files = list(self.input_dir.glob("*.vmx"))
+        vmx_files = self._files_by_ext.get('.vmx', [])
         if not vmx_files:
             raise FileNotFoundError(f"No VMware configuration (.vmx) file found in '{self.input_dir}'\n"
                                   f"Please ensure you're pointing to a VMware VM directory")
             
         # Get VM name from .vmx file
-        self.vm_name = vmx_files[0].stem
+        self.vmx_file = vmx_files[0]
+        self.vm_name = self.vmx_file.stem
         click.echo(f"Found VMware VM: {self.vm_name}")
         
     def identify_disk_structure(self):
-        """Identify VMware disk structure (split vs single disk)"""
-        vmdk_files = list(self.input_dir.glob("*.vmdk"))
+        """Identify VMware disk structure (split vs single disk)
+        
+        Returns (descriptor_files, snapshot_descriptors, data_files).
+        """
+        vmdk_files = self._files_by_ext.get('.vmdk', [])
         
         if not vmdk_files:
             raise FileNotFoundError(f"No VMware disk (.vmdk) files found in '{self.input_dir}'")
         
-        # Separate descriptor files from data files
+        # Separate descriptor files from snapshot descriptors and data files
         descriptor_files = []
+        snapshot_descriptors = []
         data_files = []
         
         for vmdk in vmdk_files:
-            # Read first few lines to determine if it's a descriptor or data file
+            # Descriptor files are small text files, so the first 4KB covers every marker
             try:
                 with open(vmdk, 'rb') as f:
-                    header = f.read(512).decode('utf-8', errors='ignore')
+                    header = f.read(4096)
                     
-                # Descriptor files contain text configuration
-                if 'createType' in header or 'parentFileNameHint' in header:
+                # Binary sparse extents (monolithicSparse, streamOptimized, ESX COWD)
+                # embed a descriptor at offset 512, inside this window; they are
+                # self-contained disks, so keep treating them as data files
+                if header.startswith((b'KDMV', b'COWD')):
+                    data_files.append(vmdk)
+                    continue
+                
+                markers = {m.lastgroup for m in self._VMDK_CLASSIFY.finditer(header)}
+                if 'snap' in markers:
+                    # Snapshot descriptors point at a parent disk (contain 'parentFileNameHint')
+                    snapshot_descriptors.append(vmdk)
+                elif 'desc' in markers:
+                    # Descriptor files contain text configuration
                     descriptor_files.append(vmdk)
+                    
+                    # Every VMware createType (monolithicSparse, twoGbMaxExtentSparse,
+                    # ...) is read by qemu-img's vmdk driver, so no probe is needed
+                    self._disk_formats[vmdk] = 'vmdk'
                 else:
                     # This is likely a flat/data file
                     data_files.append(vmdk)
@@ -60,29 +132,20 @@ class VMwareToVirtConverter:
                 # If we can't read it, assume it's a data file
                 data_files.append(vmdk)
         
-        return descriptor_files, data_files
+        return descriptor_files, snapshot_descriptors, data_files
     
     def get_disk_conversion_targets(self):
         """Get the correct VMDK files to convert based on disk structure"""
-        descriptor_files, data_files = self.identify_disk_structure()
-        
-        conversion_targets = []
+        descriptor_files, snapshot_descriptors, data_files = self.identify_disk_structure()
         
-        if descriptor_files:
+        if descriptor_files or snapshot_descriptors:
             # We have descriptor files - use them for conversion
             # qemu-img can handle split disks via descriptor files
             for desc in descriptor_files:
-                # Skip snapshot descriptors (contain 'parentFileNameHint')
-                try:
-                    with open(desc, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                        if 'parentFileNameHint' not in content:
-                            conversion_targets.append(desc)
-                            click.echo(f"Found disk descriptor: {desc.name}")
-                        else:
-                            click.echo(f"Skipping snapshot descriptor: {desc.name}")
-                except Exception as e:
-                    click.echo(f"Warning: Could not read {desc.name}: {e}")
+                click.echo(f"Found disk descriptor: {desc.name}")
+            for desc in snapshot_descriptors:
+                click.echo(f"Skipping snapshot descriptor: {desc.name}")
+            conversion_targets = descriptor_files
         else:
             # No descriptor files found - likely single monolithic disks
             conversion_targets = data_files
@@ -101,8 +164,8 @@ class VMwareToVirtConverter:
         warnings = []
         
         # Check for suspended/crashed VM state
-        vmem_files = list(self.input_dir.glob("*.vmem"))
-        vmss_files = list(self.input_dir.glob("*.vmss"))
+        vmem_files = self._files_by_ext.get('.vmem', [])
+        vmss_files = self._files_by_ext.get('.vmss', [])
         
         if vmem_files:
             warnings.append(f"Found {len(vmem_files)} memory dump files (.vmem) - VM may have been suspended or crashed")
@@ -111,7 +174,7 @@ class VMwareToVirtConverter:
             warnings.append(f"Found {len(vmss_files)} snapshot files (.vmss) - VM may be in suspended state")
         
         # Check for encrypted VM
-        vmx_files = list(self.input_dir.glob("*.vmx"))
+        vmx_files = self._files_by_ext.get('.vmx', [])
         if vmx_files:
             try:
                 vmx_config = self.parse_vmx_config(vmx_files[0])
@@ -133,73 +196,70 @@ class VMwareToVirtConverter:
                 warnings.append(f"Could not check VMX for encryption: {e}")
         
         # Check each VMDK file for bootability and encryption
-        vmdk_files = list(self.input_dir.glob("*.vmdk"))
+        vmdk_files = self._files_by_ext.get('.vmdk', [])
         bootable_disks = 0
         
+        # Skip the checks whose tools are missing rather than failing on every disk
+        for tool, tool_path in self._tools.items():
+            if tool_path is None and not (tool == "file" and self._magic is not None):
+                warnings.append(f"'{tool}' not found - skipping the checks that use it")
+        
+        # Run fdisk and file once over every candidate disk instead of once per disk
+        probe_results = self.probe_disks([vmdk for vmdk in vmdk_files
+                                          if self._stat_cache[vmdk].st_size >= 1024])
+        
         for vmdk in vmdk_files:
             click.echo(f"  Checking {vmdk.name}...")
             
             # Skip very small files that are likely descriptors
-            if vmdk.stat().st_size < 1024:
-                click.echo(f"    ℹ️  {vmdk.name} is very small ({vmdk.stat().st_size} bytes) - likely a descriptor file")
+            vmdk_size = self._stat_cache[vmdk].st_size
+            if vmdk_size < 1024:
+                click.echo(f"    ℹ️  {vmdk.name} is very small ({vmdk_size} bytes) - likely a descriptor file")
                 continue
             
             # Check if it's a text descriptor file
-            try:
-                with open(vmdk, 'r', encoding='utf-8') as f:
-                    content = f.read(1024)  # Read first 1KB
-                    if "createType" in content and "VMDK" in content:
-                        click.echo(f"    ℹ️  {vmdk.name} appears to be a descriptor file (split disk)")
-                        continue  # Skip validation for descriptor files
-            except:
-                pass  # Not a text file, continue with binary validation
+            if self.is_text_descriptor(vmdk):
+                click.echo(f"    ℹ️  {vmdk.name} appears to be a descriptor file (split disk)")
+                continue  # Skip validation for descriptor files
             
             # Check if VMDK has a partition table
             try:
                 # First check if VMDK is encrypted by trying to read it
-                encryption_check = subprocess.run([
-                    "qemu-img", "info", str(vmdk)
-                ], capture_output=True, text=True, check=False)
+                if self._tools["qemu-img"] is not None:
+                    encryption_check = subprocess.run([
+                        "qemu-img", "info", str(vmdk)
+                    ], capture_output=True, text=True, check=False)
+                    
+                    # Only fail if explicitly encrypted or completely unreadable
+                    if "encrypted: yes" in encryption_check.stdout.lower():
+                        validation_errors.append(f"{vmdk.name} is encrypted and cannot be converted")
+                        click.echo(f"    ❌ {vmdk.name} is encrypted")
+                        continue
+                    elif encryption_check.returncode != 0:
+                        # Check if it's a real encryption error vs other issues
+                        if "encrypted" in encryption_check.stderr.lower() or "password" in encryption_check.stderr.lower():
+                            validation_errors.append(f"{vmdk.name} appears to be encrypted - qemu-img cannot read it")
+                            click.echo(f"    ❌ {vmdk.name} appears encrypted (qemu-img error)")
+                            continue
+                        elif "invalid argument" in encryption_check.stderr.lower() or "could not open" in encryption_check.stderr.lower():
+                            # Likely a descriptor file or unsupported VMDK variant
+                            click.echo(f"    ℹ️  {vmdk.name} cannot be read by qemu-img (likely descriptor/split disk component)")
+                            continue
+                        else:
+                            # Just a warning for other qemu-img issues
+                            warnings.append(f"qemu-img had issues reading {vmdk.name}: {encryption_check.stderr.strip()}")
                 
-                # Only fail if explicitly encrypted or completely unreadable
-                if "encrypted: yes" in encryption_check.stdout.lower():
-                    validation_errors.append(f"{vmdk.name} is encrypted and cannot be converted")
-                    click.echo(f"    ❌ {vmdk.name} is encrypted")
+                if self._tools["fdisk"] is None:
                     continue
-                elif encryption_check.returncode != 0:
-                    # Check if it's a real encryption error vs other issues
-                    if "encrypted" in encryption_check.stderr.lower() or "password" in encryption_check.stderr.lower():
-                        validation_errors.append(f"{vmdk.name} appears to be encrypted - qemu-img cannot read it")
-                        click.echo(f"    ❌ {vmdk.name} appears encrypted (qemu-img error)")
-                        continue
-                    elif "invalid argument" in encryption_check.stderr.lower() or "could not open" in encryption_check.stderr.lower():
-                        # Likely a descriptor file or unsupported VMDK variant
-                        click.echo(f"    ℹ️  {vmdk.name} cannot be read by qemu-img (likely descriptor/split disk component)")
-                        continue
-                    else:
-                        # Just a warning for other qemu-img issues
-                        warnings.append(f"qemu-img had issues reading {vmdk.name}: {encryption_check.stderr.strip()}")
                 
-                result = subprocess.run([
-                    "fdisk", "-l", str(vmdk)
-                ], capture_output=True, text=True, check=False)
+                fdisk_output, _ = probe_results[vmdk]
                 
-                if "Disklabel type:" in result.stdout or "Device" in result.stdout:
+                if "Disklabel type:" in fdisk_output or "Device" in fdisk_output:
                     click.echo(f"    ✅ {vmdk.name} has valid partition table")
                     bootable_disks += 1
                 else:
                     click.echo(f"    ⚠️  {vmdk.name} has no detectable partition table")
                     
-                    # Check if it's a descriptor file (split disk)
-                    try:
-                        with open(vmdk, 'r', encoding='utf-8') as f:
-                            content = f.read(1024)  # Read first 1KB
-                            if "createType" in content and "VMDK" in content:
-                                click.echo(f"    ℹ️  {vmdk.name} appears to be a descriptor file (split disk)")
-                                continue  # Skip validation for descriptor files
-                    except:
-                        pass
-                    
                     # Warn instead of failing - some VMs may still be bootable
                     warnings.append(f"{vmdk.name} has no detectable partition table - VM may not boot properly")
                         
@@ -207,22 +267,14 @@ class VMwareToVirtConverter:
                 warnings.append(f"Could not analyze {vmdk.name}: {e}")
         
         # Check for boot sector signatures
-        for vmdk in vmdk_files:
-            if vmdk.stat().st_size < 1024:  # Skip very small files
-                continue
-                
-            try:
-                result = subprocess.run([
-                    "file", "-s", str(vmdk)
-                ], capture_output=True, text=True, check=False)
-                
-                if "boot sector" in result.stdout.lower() or "filesystem" in result.stdout.lower():
+        if self._magic is not None or self._tools["file"] is not None:
+            for vmdk, (_, file_output) in probe_results.items():
+                if "boot sector" in file_output.lower() or "filesystem" in file_output.lower():
                     click.echo(f"    ✅ {vmdk.name} has recognizable boot/filesystem signature")
-                elif "data" == result.stdout.strip().split(": ")[1]:
+                elif file_output.strip() == "data":
                     warnings.append(f"{vmdk.name} shows as 'data' with no recognizable structure")
-                    
-            except Exception as e:
-                warnings.append(f"Could not check boot signature for {vmdk.name}: {e}")
+                elif not file_output:
+                    warnings.append(f"Could not check boot signature for {vmdk.name}")
         
         # Display warnings
         if warnings:
@@ -261,89 +313,249 @@ class VMwareToVirtConverter:
         click.echo("\n✅ VM validation passed - proceeding with conversion")
         return True
     
+    def is_text_descriptor(self, vmdk):
+        """Check whether a VMDK is a plain-text split disk descriptor"""
+        try:
+            with open(vmdk, 'rb') as f:
+                content = f.read(1024)  # Read first 1KB
+            # Binary extents are not valid text; the incremental decoder tolerates a
+            # multi-byte character cut off at the end of the 1KB read
+            codecs.getincrementaldecoder('utf-8')().decode(content)
+        except (OSError, UnicodeDecodeError):
+            return False
+        
+        markers = {m.lastgroup for m in self._VMDK_CLASSIFY.finditer(content)}
+        return 'desc' in markers and 'vmdk' in markers
+    
+    def probe_disks(self, vmdk_files):
+        """Run fdisk and file once over all disks and split the output per disk
+        
+        File types come from python-magic when it is installed, without spawning file.
+        
+        Returns a dict mapping each VMDK to its (fdisk output, file description).
+        """
+        if not vmdk_files:
+            return {}
+        
+        paths = [str(vmdk) for vmdk in vmdk_files]
+        fdisk_sections = {}
+        file_descriptions = {}
+        
+        if self._tools["fdisk"] is not None:
+            try:
+                fdisk_result = subprocess.run([
+                    "fdisk", "-l", *paths
+                ], capture_output=True, text=True, check=False)
+                
+                # fdisk starts each disk's section with a "Disk <path>: ..." header
+                current = None
+                for line in fdisk_result.stdout.splitlines(keepends=True):
+                    if line.startswith("Disk "):
+                        for vmdk, path in zip(vmdk_files, paths):
+                            if line.startswith(f"Disk {path}:"):
+                                current = vmdk
+                                break
+                    if current is not None:
+                        fdisk_sections[current] = fdisk_sections.get(current, "") + line
+            except Exception as e:
+                click.echo(f"    ⚠️  Could not run fdisk: {e}")
+        
+        if self._magic is not None:
+            for vmdk, path in zip(vmdk_files, paths):
+                try:
+                    file_descriptions[vmdk] = self._magic.from_file(path)
+                except Exception as e:
+                    click.echo(f"    ⚠️  Could not identify {vmdk.name}: {e}")
+        elif self._tools["file"] is not None:
+            try:
+                file_result = subprocess.run([
+                    "file", "-s", *paths
+                ], capture_output=True, text=True, check=False)
+                
+                # file prints one "<path>: <description>" line per disk, padding
+                # the descriptions into a column when given several paths
+                for line in file_result.stdout.splitlines():
+                    for vmdk, path in zip(vmdk_files, paths):
+                        if line.startswith(f"{path}:"):
+                            file_descriptions[vmdk] = line[len(path) + 1:].strip()
+                            break
+            except Exception as e:
+                click.echo(f"    ⚠️  Could not run file: {e}")
+        
+        return {vmdk: (fdisk_sections.get(vmdk, ""), file_descriptions.get(vmdk, ""))
+                for vmdk in vmdk_files}
+    
     def convert_disk_images(self):
         """Convert VMDK files to QCOW2 format"""
         click.echo("\n🔄 Converting disk images...")
         
         # Check if qemu-img is available
-        try:
-            subprocess.run(["qemu-img", "--version"], capture_output=True, check=True)
-        except (subprocess.CalledProcessError, FileNotFoundError):
+        if self._tools["qemu-img"] is None:
             raise RuntimeError("qemu-img not found. Please install qemu-utils package:\n"
                              "  Ubuntu/Debian: sudo apt-get install qemu-utils\n"
                              "  CentOS/RHEL: sudo yum install qemu-img\n"
                              "  Fedora: sudo dnf install qemu-img")
         
+        # On qemu-img 2.9+ keep more requests in flight with parallel coroutines.
+        # Out-of-order writes (-W) are left off: on a growing qcow2 target they
+        # allocate clusters out of guest order and fragment the image.
+        self.convert_options = []
+        if self.get_qemu_img_version() >= (2, 9):
+            self.convert_options += ["-m", "16"]
+        
         # Get the correct files to convert
         conversion_targets = self.get_disk_conversion_targets()
         
         click.echo(f"Converting {len(conversion_targets)} disk image(s)...")
         
-        for i, vmdk in enumerate(conversion_targets, 1):
-            output_path = self.output_dir / f"{vmdk.stem}.qcow2"
-            
-            click.echo(f"  [{i}/{len(conversion_targets)}] Converting {vmdk.name} -> {output_path.name}")
-            
+        # Each conversion is bound by qemu-img's I/O, so run several disks at once.
+        # Progress redraws from parallel disks would overwrite each other, so they
+        # are only streamed for a single disk; otherwise each disk reports when done.
+        self._stream_progress = len(conversion_targets) == 1
+        with ThreadPoolExecutor(max_workers=min(4, len(conversion_targets))) as executor:
+            futures = {
+                executor.submit(self._convert_one, vmdk, i, len(conversion_targets)): vmdk
+                for i, vmdk in enumerate(conversion_targets, 1)
+            }
+            converted = {}
             try:
-                # Detect the actual format of the VMDK file
+                for future in as_completed(futures):
+                    converted[futures[future]] = future.result()
+            except Exception:
+                # Stop at the first failure: don't start the disks still queued
+                for pending in futures:
+                    pending.cancel()
+                raise
+        
+        # Keep disks in target order so the boot disk stays first in the XML
+        self.disk_files.extend(converted[vmdk] for vmdk in conversion_targets)
+    
+    def _convert_one(self, vmdk, i, total):
+        """Convert a single VMDK to QCOW2 and return the output path"""
+        output_path = self.output_dir / f"{vmdk.stem}.qcow2"
+        
+        click.echo(f"  [{i}/{total}] Converting {vmdk.name} -> {output_path.name}")
+        
+        try:
+            # Detect the actual format of the VMDK file, unless its descriptor told us
+            detected_format = self._disk_formats.get(vmdk)
+            if detected_format is None:
                 format_result = subprocess.run([
                     "qemu-img", "info", "--output=json", str(vmdk)
                 ], capture_output=True, text=True, check=True)
                 
-                import json
                 info = json.loads(format_result.stdout)
                 detected_format = info.get('format', 'vmdk')
-                
-                click.echo(f"    Detected format: {detected_format}")
-                
-                # For raw format VMDKs, we need to be more careful about preserving boot sectors
-                if detected_format == 'raw':
-                    click.echo(f"    Raw format detected - using special conversion to preserve boot sector")
-                    
-                    # First, try to convert as vmdk format to preserve structure
-                    try:
-                        result = subprocess.run([
-                            "qemu-img", "convert", "-f", "vmdk",
-                            "-O", "qcow2", "-p",
-                            str(vmdk),
-                            str(output_path)
-                        ], capture_output=True, text=True, check=True)
-                        click.echo(f"    ✅ Successfully converted as VMDK format (preserving structure)")
-                    except subprocess.CalledProcessError:
-                        # If VMDK format fails, fall back to raw format
-                        click.echo(f"    VMDK format failed, using raw format conversion")
-                        click.echo(f"    Converting {vmdk.stat().st_size // (1024**3):.1f}GB disk - this should take 5-15 minutes...")
-                        result = subprocess.run([
-                            "qemu-img", "convert", "-f", "raw",
-                            "-O", "qcow2", "-p",
-                            str(vmdk),
-                            str(output_path)
-                        ], text=True, check=True)  # Remove capture_output to show progress
-                        
-                        if result.stderr:
-                            click.echo(f"    Warning: {result.stderr}")
-                else:
-                    # Use detected format for non-raw formats
-                    click.echo(f"    Converting {vmdk.stat().st_size // (1024**3):.1f}GB disk as {detected_format} format - this may take several minutes...")
-                    result = subprocess.run([
-                        "qemu-img", "convert", "-f", detected_format,
-                        "-O", "qcow2", "-p",
-                        str(vmdk),
-                        str(output_path)
-                    ], text=True, check=True)  # Remove capture_output to show progress
-                
-                # Verify the converted disk has a valid partition table
+            
+            click.echo(f"    {vmdk.name}: detected format {detected_format}")
+            
+            # For raw format VMDKs, we need to be more careful about preserving boot sectors:
+            # try converting as vmdk first to preserve structure, then fall back to raw
+            source_format = detected_format
+            if detected_format == 'raw':
+                click.echo(f"    {vmdk.name}: raw format detected - using special conversion to preserve boot sector")
+                source_format = 'vmdk'
+            
+            # Size comes from the directory scan; the file isn't modified during the run
+            size_gb = self._stat_cache[vmdk].st_size / (1024**3)
+            click.echo(f"    {vmdk.name}: converting {size_gb:.1f}GB disk as {source_format} format - this may take several minutes...")
+            try:
+                self.run_qemu_convert(source_format, vmdk, output_path)
+            except subprocess.CalledProcessError:
+                if detected_format != 'raw':
+                    raise
+                click.echo(f"    {vmdk.name}: VMDK format failed, using raw format conversion")
+                self.run_qemu_convert('raw', vmdk, output_path)
+            
+            # qemu-img convert already fails on conversion errors, so the extra
+            # checks only run when asked for
+            if self.verify:
                 self.verify_converted_disk(output_path)
-                
-                self.disk_files.append(output_path)
-                click.echo(f"    ✅ Successfully converted {vmdk.name}")
-                
-            except subprocess.CalledProcessError as e:
-                error_msg = e.stderr if e.stderr else str(e)
-                raise RuntimeError(f"Failed to convert {vmdk.name}: {error_msg}")
+            if self.repair:
+                self.check_partition_table(output_path)
+            
+            click.echo(f"    ✅ Successfully converted {vmdk.name}")
+            # Resolve once here so the XML generator can use the path as-is
+            return output_path.resolve()
+        
+        except subprocess.CalledProcessError as e:
+            error_msg = e.stderr if e.stderr else str(e)
+            raise RuntimeError(f"Failed to convert {vmdk.name}: {error_msg}")
+    
+    def get_qemu_img_version(self):
+        """Return the installed qemu-img (major, minor) version, probed only once"""
+        if self._qemu_img_version is None:
+            self._qemu_img_version = (0, 0)
+            try:
+                result = subprocess.run(["qemu-img", "--version"], capture_output=True,
+                                        text=True, check=False)
+                version_match = re.search(r'version (\d+)\.(\d+)', result.stdout)
+                if version_match:
+                    self._qemu_img_version = tuple(map(int, version_match.groups()))
+            except OSError:
+                pass
+        return self._qemu_img_version
+    
+    def run_qemu_convert(self, source_format, vmdk, output_path):
+        """Run qemu-img convert, streaming its progress output to the console
+        
+        Progress is only streamed while a single disk is converting. Errors are
+        collected from stderr separately so they are never mixed with progress.
+        """
+        cmd = [
+            "qemu-img", "convert", "-f", source_format,
+            "-O", "qcow2", "-p", *self.convert_options,
+            str(vmdk),
+            str(output_path)
+        ]
+        
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        
+        # Drain stderr on its own thread so a chatty qemu-img can't block on a full pipe
+        stderr_chunks = []
+        stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()))
+        stderr_reader.start()
+        
+        # qemu-img redraws its progress on stdout with '\r', so forward raw chunks
+        # as they arrive instead of buffering the whole run
+        for chunk in iter(lambda: process.stdout.read1(4096), b''):
+            if self._stream_progress:
+                click.echo(chunk.decode('utf-8', errors='replace'), nl=False)
+        process.stdout.close()
+        stderr_reader.join()
+        process.stderr.close()
+        process.wait()
+        if self._stream_progress:
+            click.echo()
+        
+        if process.returncode:
+            stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace')
+            raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr.strip())
     
     def verify_converted_disk(self, disk_path):
-        """Verify that the converted disk has a valid partition table"""
+        """Verify the converted disk's qcow2 metadata with qemu-img check"""
+        try:
+            result = subprocess.run([
+                "qemu-img", "check", str(disk_path)
+            ], capture_output=True, text=True, check=False)
+        except Exception as e:
+            click.echo(f"    ⚠️  Could not verify {disk_path.name}: {e}")
+            return False
+        
+        # Exit code 3 means leaked clusters only, which wastes space but loses no data
+        if result.returncode in (0, 3):
+            click.echo(f"    ✅ qemu-img check found no errors in {disk_path.name}")
+            return True
+        
+        click.echo(f"    ⚠️  qemu-img check reported problems in {disk_path.name}: {(result.stderr or result.stdout).strip()}")
+        return False
+    
+    def check_partition_table(self, disk_path):
+        """Check that the converted disk has a valid partition table, repairing it if not"""
+        if self._tools["fdisk"] is None:
+            click.echo(f"    ⚠️  fdisk not found - skipping partition table check")
+            return False
+        
         try:
             # Check if the disk has a valid partition table
             result = subprocess.run([
@@ -351,33 +563,39 @@ class VMwareToVirtConverter:
             ], capture_output=True, text=True, check=False)
             
             if "Disklabel type:" in result.stdout or "Device" in result.stdout:
-                click.echo(f"    ✅ Partition table detected in converted disk")
+                click.echo(f"    ✅ Partition table detected in {disk_path.name}")
                 return True
             else:
-                click.echo(f"    ⚠️  Warning: No partition table detected - attempting to fix")
+                click.echo(f"    ⚠️  Warning: No partition table detected in {disk_path.name} - attempting to fix")
                 return self.attempt_boot_sector_fix(disk_path)
                 
         except Exception as e:
-            click.echo(f"    ⚠️  Could not verify disk structure: {e}")
+            click.echo(f"    ⚠️  Could not verify disk structure of {disk_path.name}: {e}")
             return False
     
     def attempt_boot_sector_fix(self, disk_path):
         """Attempt to fix boot sector issues in the converted disk"""
         try:
-            click.echo(f"    Attempting to repair boot sector...")
+            click.echo(f"    Attempting to repair boot sector of {disk_path.name}...")
             
             # Try to detect if this is a Windows disk and attempt MBR repair
             # First, check if we can detect any filesystem signatures
-            result = subprocess.run([
-                "file", "-s", str(disk_path)
-            ], capture_output=True, text=True, check=False)
+            if self._magic is not None:
+                description = self._magic.from_file(str(disk_path))
+            elif self._tools["file"] is not None:
+                description = subprocess.run([
+                    "file", "-s", str(disk_path)
+                ], capture_output=True, text=True, check=False).stdout
+            else:
+                click.echo(f"    ⚠️  file not found - cannot detect disk type for automatic repair")
+                return False
             
-            if "DOS/MBR boot sector" in result.stdout or "Microsoft" in result.stdout:
+            if "DOS/MBR boot sector" in description or "Microsoft" in description:
                 click.echo(f"    Windows/DOS boot sector detected - attempting MBR repair")
                 
                 # Create a backup first
                 backup_path = str(disk_path) + ".backup"
-                subprocess.run(["cp", str(disk_path), backup_path], check=True)
+                self.clone_file(disk_path, backup_path)
                 
                 # Try to use testdisk to repair the partition table
                 try:
@@ -388,13 +606,16 @@ quick_search
 write
 quit"""
                     
-                    with open("/tmp/testdisk_script.txt", "w") as f:
+                    # Use a private temp file rather than a fixed, predictable /tmp path
+                    with tempfile.NamedTemporaryFile('w', prefix='testdisk_', suffix='.txt',
+                                                     delete=False) as f:
                         f.write(script_content)
                     
                     # Note: testdisk would need to be installed
                     # For now, we'll provide instructions to the user
                     click.echo(f"    ⚠️  Boot sector repair requires manual intervention")
                     click.echo(f"    Backup created at: {backup_path}")
+                    click.echo(f"    testdisk repair script written to: {f.name}")
                     click.echo(f"    Consider using tools like 'testdisk' or 'gparted' to repair the partition table")
                     
                 except Exception as repair_error:
@@ -406,112 +627,102 @@ quit"""
             return False  # Indicate that manual intervention may be needed
             
         except Exception as e:
-            click.echo(f"    ⚠️  Boot sector repair failed: {e}")
+            click.echo(f"    ⚠️  Boot sector repair of {disk_path.name} failed: {e}")
             return False
             
+    def clone_file(self, src, dst):
+        """Copy a file, as an instant copy-on-write clone where the filesystem allows
+        
+        btrfs/XFS support FICLONE; elsewhere this falls back to an in-kernel copy.
+        Hardlinks are never used: the copy must not change when the original is
+        rewritten in place (by testdisk, or by VMware updating its .nvram).
+        """
+        # A hardlink left by an older run would be truncated along with the source
+        if os.path.lexists(dst) and os.path.samefile(src, dst):
+            os.unlink(dst)
+        
+        try:
+            import fcntl
+            with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except (ImportError, OSError):
+            shutil.copyfile(src, dst)
+    
     def parse_vmx_config(self, vmx_file):
         """Parse VMware VMX configuration file"""
-        config = {}
-        try:
-            # Try UTF-8 first
-            with open(vmx_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except UnicodeDecodeError:
-            # Fall back to latin-1 if UTF-8 fails
-            try:
-                with open(vmx_file, 'r', encoding='latin-1') as f:
-                    content = f.read()
-            except UnicodeDecodeError:
-                # Last resort: read as binary and decode with errors ignored
-                with open(vmx_file, 'rb') as f:
-                    content = f.read().decode('utf-8', errors='ignore')
-        
-        for line in content.splitlines():
-            line = line.strip()
-            if '=' in line and not line.startswith('#'):
-                key, value = line.split('=', 1)
-                config[key.strip()] = value.strip().strip('"')
-        return config
+        # VMX files are plain 'key = "value"' lines; match them all in one regex
+        # pass over a read-only mapping of the file, skipping comments and anything
+        # malformed, so large configs are never copied into a Python string first
+        with open(vmx_file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return {}  # mmap cannot map an empty file
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                return {m.group(1).decode('ascii'): m.group(2).decode('utf-8', errors='replace')
+                        for m in self._VMX_LINE.finditer(content)}
         
     def generate_libvirt_xml(self, vmx_config):
         """Generate libvirt XML configuration from VMware VMX config"""
-        import uuid
-        
-        # Create a minimal, guaranteed-to-work libvirt XML template
-        xml_template = '''<?xml version="1.0" encoding="UTF-8"?>
-<domain type="kvm">
-  <name>{vm_name}</name>
-  <uuid>{vm_uuid}</uuid>
-  <memory unit="KiB">{memory_kb}</memory>
-  <currentMemory unit="KiB">{memory_kb}</currentMemory>
-  <vcpu placement="static">{vcpus}</vcpu>
-  <os>
-    <type arch="x86_64" machine="pc-q35-6.2">hvm</type>
-    <boot dev="hd"/>
-  </os>
-  <features>
-    <acpi/>
-    <apic/>
-  </features>
-  <cpu mode="host-passthrough"/>
-  <clock offset="utc"/>
-  <on_poweroff>destroy</on_poweroff>
-  <on_reboot>restart</on_reboot>
-  <on_crash>destroy</on_crash>
-  <devices>
-    <emulator>/usr/bin/qemu-system-x86_64</emulator>
-{disk_xml}
-    <interface type="network">
-      <source network="default"/>
-      <model type="e1000"/>
-    </interface>
-    <serial type="pty">
-      <target port="0"/>
-    </serial>
-    <console type="pty">
-      <target type="serial" port="0"/>
-    </console>
-    <input type="mouse" bus="ps2"/>
-    <input type="keyboard" bus="ps2"/>
-    <graphics type="vnc" port="-1" autoport="yes"/>
-    <video>
-      <model type="cirrus" vram="16384" heads="1" primary="yes"/>
-    </video>
-  </devices>
-</domain>'''
-        
-        # Generate disk XML with absolute paths and proper escaping
-        disk_xml_parts = []
-        for i, disk_file in enumerate(self.disk_files):
-            # Get absolute path and ensure it exists
-            abs_disk_path = str(disk_file.resolve())
-            if not disk_file.exists():
-                raise FileNotFoundError(f"Disk file does not exist: {abs_disk_path}")
-                
-            # Create disk XML with SATA bus for Q35 compatibility
-            disk_xml = f'''    <disk type="file" device="disk">
-      <driver name="qemu" type="qcow2" cache="writethrough"/>
-      <source file="{abs_disk_path}"/>
-      <target dev="sd{chr(97 + i)}" bus="sata"/>
-    </disk>'''
-            disk_xml_parts.append(disk_xml)
-        
         # Get VM configuration
         memory_mb = int(vmx_config.get('memsize', '1024'))
         memory_kb = memory_mb * 1024
         vcpus = vmx_config.get('numvcpus', '1')
         vm_uuid = str(uuid.uuid4())
         
-        # Format the XML template
-        final_xml = xml_template.format(
-            vm_name=self.vm_name,
-            vm_uuid=vm_uuid,
-            memory_kb=memory_kb,
-            vcpus=vcpus,
-            disk_xml='\n'.join(disk_xml_parts)
-        )
+        # Build a minimal, guaranteed-to-work libvirt domain; ElementTree takes care
+        # of escaping the VM name and disk paths
+        domain = ET.Element('domain', type='kvm')
+        ET.SubElement(domain, 'name').text = self.vm_name
+        ET.SubElement(domain, 'uuid').text = vm_uuid
+        ET.SubElement(domain, 'memory', unit='KiB').text = str(memory_kb)
+        ET.SubElement(domain, 'currentMemory', unit='KiB').text = str(memory_kb)
+        ET.SubElement(domain, 'vcpu', placement='static').text = str(vcpus)
+        
+        os_element = ET.SubElement(domain, 'os')
+        ET.SubElement(os_element, 'type', arch='x86_64', machine='pc-q35-6.2').text = 'hvm'
+        ET.SubElement(os_element, 'boot', dev='hd')
+        
+        features = ET.SubElement(domain, 'features')
+        ET.SubElement(features, 'acpi')
+        ET.SubElement(features, 'apic')
+        
+        ET.SubElement(domain, 'cpu', mode='host-passthrough')
+        ET.SubElement(domain, 'clock', offset='utc')
+        ET.SubElement(domain, 'on_poweroff').text = 'destroy'
+        ET.SubElement(domain, 'on_reboot').text = 'restart'
+        ET.SubElement(domain, 'on_crash').text = 'destroy'
+        
+        devices = ET.SubElement(domain, 'devices')
+        ET.SubElement(devices, 'emulator').text = '/usr/bin/qemu-system-x86_64'
+        
+        # Generate disk XML; disk_files already holds the absolute paths just written
+        # by convert_disk_images (a missing file surfaces at 'virsh define')
+        for i, disk_file in enumerate(self.disk_files):
+            # Create disk XML with SATA bus for Q35 compatibility
+            disk = ET.SubElement(devices, 'disk', type='file', device='disk')
+            ET.SubElement(disk, 'driver', name='qemu', type='qcow2', cache='writethrough')
+            ET.SubElement(disk, 'source', file=str(disk_file))
+            ET.SubElement(disk, 'target', dev=f"sd{chr(97 + i)}", bus='sata')
+        
+        interface = ET.SubElement(devices, 'interface', type='network')
+        ET.SubElement(interface, 'source', network='default')
+        ET.SubElement(interface, 'model', type='e1000')
+        
+        serial = ET.SubElement(devices, 'serial', type='pty')
+        ET.SubElement(serial, 'target', port='0')
+        console = ET.SubElement(devices, 'console', type='pty')
+        ET.SubElement(console, 'target', type='serial', port='0')
         
-        return final_xml
+        ET.SubElement(devices, 'input', type='mouse', bus='ps2')
+        ET.SubElement(devices, 'input', type='keyboard', bus='ps2')
+        ET.SubElement(devices, 'graphics', type='vnc', port='-1', autoport='yes')
+        video = ET.SubElement(devices, 'video')
+        ET.SubElement(video, 'model', type='cirrus', vram='16384', heads='1', primary='yes')
+        
+        # ET.indent is only available on Python 3.9+; the XML is valid either way
+        if hasattr(ET, 'indent'):
+            ET.indent(domain)
+        
+        return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(domain, encoding='unicode')
         
     def create_output_structure(self):
         """Create output directory structure and copy necessary files"""
@@ -528,10 +739,14 @@ quit"""
             
         # Copy any additional files that might be needed
         additional_files = []
-        for file in self.input_dir.glob("*.*"):
-            if file.suffix not in ['.vmdk', '.vmx', '.vmsd', '.log']:
+        for suffix, files in self._files_by_ext.items():
+            if suffix in ['', '.vmdk', '.vmx', '.vmsd', '.log']:
+                continue
+            for file in files:
                 try:
-                    shutil.copy2(file, self.output_dir / file.name)
+                    target = self.output_dir / file.name
+                    self.clone_file(file, target)
+                    shutil.copystat(file, target)
                     additional_files.append(file.name)
                 except Exception as e:
                     click.echo(f"Warning: Could not copy {file.name}: {e}")
@@ -545,8 +760,10 @@ quit"""
 @click.argument('output_dir', type=click.Path(file_okay=False, dir_okay=True), 
                 required=False)
 @click.option('--verbose', '-v', is_flag=True, help='Enable verbose output')
+@click.option('--verify', is_flag=True, help='Check converted disks with qemu-img check')
+@click.option('--repair', is_flag=True, help='Attempt boot sector repair on disks without a partition table')
 @click.help_option('--help', '-h')
-def main(input_dir, output_dir, verbose):
+def main(input_dir, output_dir, verbose, verify, repair):
     """Convert VMware VM to virt-manager format
     
     INPUT_DIR: Path to directory containing VMware VM files (.vmx, .vmdk)
@@ -567,7 +784,7 @@ def main(input_dir, output_dir, verbose):
         logging.basicConfig(level=logging.DEBUG)
     else:
         logging.basicConfig(level=logging.INFO)
-    converter = VMwareToVirtConverter(input_dir, output_dir)
+    converter = VMwareToVirtConverter(input_dir, output_dir, verify=verify, repair=repair)
     
     try:
         click.echo(f"Starting conversion from '{input_dir}' to '{output_dir}'")
@@ -587,17 +804,16 @@ def main(input_dir, output_dir, verbose):
         converter.convert_disk_images()
         
         # Parse VMX config
-        vmx_file = next(converter.input_dir.glob("*.vmx"))
+        vmx_file = converter.vmx_file
         click.echo(f"Processing configuration file: {vmx_file.name}")
         vmx_config = converter.parse_vmx_config(vmx_file)
         
         # Generate libvirt XML
         xml_config = converter.generate_libvirt_xml(vmx_config)
         
-        # Write XML to file
+        # Write XML to file as UTF-8 (as declared in its header), with no CRLF translation
         xml_file = converter.output_dir / f"{converter.vm_name}.xml"
-        with open(xml_file, 'w') as f:
-            f.write(xml_config)
+        xml_file.write_bytes(xml_config.encode('utf-8'))
             
         click.echo(f"\n✅ Conversion completed successfully!")
         click.echo(f"📁 VM files converted to: {converter.output_dir}")